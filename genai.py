@@ -1,24 +1,21 @@
 import argparse
-import multiprocessing
-import json
 import logging
-import os # For pathsep
+import os
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor
+import ijson
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from colorama import Fore, Style, init
 
 import utils
-import prompts
 
 logger = logging.getLogger(__name__)
 
-def process_file(json_path, config):
+def process_file(json_path, config, client=None, no_cache=False):
     """
     Stage 2 Logic:
     1. Read transcript
-    2. Construct prompt
-    3. Call Gemini
+    2. Call Gemini (batched with other in-flight files by utils.process_with_gemini)
     """
     json_path = Path(json_path)
     
@@ -26,25 +23,27 @@ def process_file(json_path, config):
         return f"Error: File {json_path} not found."
 
     try:
-        # Prepare data for prompt
-        with open(json_path, 'r', encoding='utf-8') as f:
-            transcript_data = json.load(f)
-        
+        # Prepare data for prompt: stream segments one at a time instead of
+        # materializing the whole (possibly tens of MB) Whisper transcript.
+        # The plain text (semantic cache key) is collected in the same pass.
         simplified_transcript = []
-        for seg in transcript_data.get("segments", []):
-            simplified_transcript.append({
-                "start": round(seg.get("start", 0), 2),
-                "end": round(seg.get("end", 0), 2),
-                "text": seg.get("text", "")
-            })
+        texts = []
+        with open(json_path, 'rb') as f:
+            for seg in ijson.items(f, 'segments.item', use_float=True):
+                text = seg.get("text", "")
+                simplified_transcript.append({
+                    "start": round(seg.get("start", 0), 2),
+                    "end": round(seg.get("end", 0), 2),
+                    "text": text
+                })
+                texts.append(text.strip())
+        text = " ".join(texts)
             
-        # Construct Prompt
-        prompt_text = prompts.GEMINI_PROMPT_TEMPLATE.format(
-            transcript_json=json.dumps(simplified_transcript, indent=2)
-        )
-        
         # Gemini processing
-        refined_data, refined_json_path = utils.process_with_gemini(str(json_path), config, prompt_text)
+        refined_data, refined_json_path = utils.process_with_gemini(
+            str(json_path), config, simplified_transcript,
+            text=text, no_cache=no_cache, client=client
+        )
         
         logger.info(f"Refined JSON saved: {refined_json_path.name}")
         return f"Success: Refined segments saved to {refined_json_path.name} (Detected Title: {refined_data.get('title')})"
@@ -52,33 +51,61 @@ def process_file(json_path, config):
     except Exception as e:
         return f"Error in Stage 2 for {json_path.name}: {str(e)}"
 
-def wrapper_process(json_path):
-    config = utils.load_config("config.json")
-    return process_file(json_path, config)
-
 if __name__ == "__main__":
-    multiprocessing.freeze_support()
     init(autoreset=True)
     utils.setup_logging(is_main_process=True)
 
     parser = argparse.ArgumentParser(description="Stage 2 GenAI Refiner (Process JSON files with Gemini)")
     parser.add_argument("--input", "-i", type=str, default="input", help="Directory containing .json transcripts")
-    parser.add_argument("--workers", "-w", type=int, default=2)
+    parser.add_argument("--workers", "-w", type=int, default=None, help="Concurrent files in flight, and concurrent Gemini requests (default: min(32, files))")
+    parser.add_argument("--batch-size", "-b", type=int, default=1, help="Max transcripts coalesced into one Gemini request (1 = one request per file)")
+    parser.add_argument("--batch-wait-ms", type=int, default=200, help="Max time to wait for a batch to fill")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response caches and always call Gemini")
     args = parser.parse_args()
 
     input_path = Path(args.input)
     
-    # Target JSON files, but exclude ones already refined
-    all_json = list(input_path.glob("*.json"))
-    files = [f for f in all_json if not f.name.endswith("_refined.json")]
+    # Target JSON transcripts, excluding refined outputs and transcripts whose
+    # refined JSON is newer than they are (a re-transcribed video gets re-refined)
+    entries = {}
+    if input_path.is_dir():
+        with os.scandir(input_path) as it:
+            entries = {e.name: e for e in it if e.is_file()}
+
+    def is_refined(name):
+        refined = entries.get(f"{name[:-5]}_refined.json")
+        return refined is not None and refined.stat().st_mtime_ns >= entries[name].stat().st_mtime_ns
+
+    files = [
+        input_path / n for n in sorted(entries)
+        if n.endswith(".json") and not n.endswith("_refined.json") and not is_refined(n)
+    ]
 
     if not files:
-        print(f"No transcript files (.json) found in {input_path}")
+        print(f"No unrefined transcript files (.json) found in {input_path}")
         exit()
 
-    print(f"{Fore.CYAN}Starting Stage 2 (Gemini Refinement) for {len(files)} JSON files with {args.workers} workers...{Style.RESET_ALL}")
+    # Threads only wait on Gemini; more than ~32 just contends for the rate limit
+    workers = args.workers or min(32, len(files))
+
+    print(f"{Fore.CYAN}Starting Stage 2 (Gemini Refinement) for {len(files)} JSON files with {workers} workers...{Style.RESET_ALL}")
 
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        futures = {executor.submit(wrapper_process, f): f for f in files}
+    config = utils.get_config("config.json")
+    try:
+        client = utils.get_gemini_client(config)
+    except ValueError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        exit(1)
+    # Concurrency follows --workers, not the batch size: a batch's output (every
+    # refined document) is generated serially, so fewer requests is not faster
+    batcher = utils.get_gemini_batcher(
+        config, client=client, max_batch=args.batch_size, max_wait_ms=args.batch_wait_ms,
+        max_concurrency=workers
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, f, config, client, args.no_cache): f for f in files}
         for future in tqdm(futures, total=len(files), desc="Processing JSONs"):
             tqdm.write(future.result())
+
+    batcher.close()
@@ -1,4 +1,6 @@
-GEMINI_PROMPT_TEMPLATE = """
+# Static instruction block shared by every Stage 2 request. It is uploaded once
+# as Gemini cached content, so keep anything per-file out of it.
+GEMINI_PROMPT_PREFIX = """
 You are an expert video editor and content curator. I will provide you with a JSON transcript of a video.
 Your task:
 1. Identify a compelling Title for the video based on the context. 
@@ -9,17 +11,28 @@ Your task:
 6. Ensure the final selected segments flow logically.
 7. Targeted length: The final video should ideally be 15-20 minutes in total duration.
 
-TRANSCRIPT JSON:
-{transcript_json}
-
 OUTPUT FORMAT (STRICT JSON):
-{{
+{
   "title": "...",
   "detected_language": "...",
   "detected_keywords": ["...", "..."],
   "meaningful_segments": [
-    {{"start": 0.0, "end": 10.5, "text": "..."}},
+    {"start": 0.0, "end": 10.5, "text": "..."},
     ...
   ]
-}}
+}
+"""
+
+GEMINI_PROMPT_USER_TEMPLATE = """
+TRANSCRIPT JSON:
+{transcript_json}
+"""
+
+GEMINI_BATCH_PROMPT_USER_TEMPLATE = """
+This request contains several videos instead of one: a JSON array where each element has an "id" and a "transcript".
+Apply the task above to every transcript independently and return a STRICT JSON ARRAY with exactly one
+object per input transcript, in the output format above plus an "id" field echoing its transcript's id.
+
+TRANSCRIPTS JSON:
+{transcripts_json}
 """
@@ -0,0 +1,132 @@
+import orjson
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 384 # all-MiniLM-L6-v2
+MAX_TOKENS = 256 # MiniLM was trained on 256-token windows
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+class SemanticCache:
+    """
+    Local cache of refined transcripts keyed by transcript embedding.
+    Embeddings come from a local all-MiniLM-L6-v2 ONNX export (no extra API hop)
+    and are stored in a sqlite-vec `vec0` table next to the refined JSON, so a
+    near-duplicate transcript is served by a vector lookup instead of a Gemini call.
+    """
+
+    def __init__(self, db_path, model_dir, threshold=0.05, ttl_seconds=None):
+        # Heavy optional deps, only needed when the cache is enabled
+        import numpy as np
+        import onnxruntime
+        import sqlite_vec
+        from tokenizers import Tokenizer
+
+        self._np = np
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+
+        model_dir = Path(model_dir)
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_TOKENS)
+        self.tokenizer.enable_padding()
+        self.session = onnxruntime.InferenceSession(str(model_dir / "model.onnx"), providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.enable_load_extension(True)
+        sqlite_vec.load(self.db)
+        self.db.enable_load_extension(False)
+        self.db.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS cache USING vec0("
+            f"embedding float[{EMBEDDING_DIM}] distance_metric=cosine, "
+            f"+refined_json text, +created_at integer)"
+        )
+        self.db.commit()
+
+    def embed(self, text):
+        """
+        Embed arbitrarily long text: split into MAX_TOKENS windows, mean-pool each
+        window's token embeddings, then average the windows and L2-normalize.
+        """
+        np = self._np
+        words = text.split()
+        # ~0.75 words per token keeps most windows under the truncation limit
+        step = int(MAX_TOKENS * 0.75)
+        chunks = [" ".join(words[i:i + step]) for i in range(0, len(words), step)] or [""]
+
+        encodings = self.tokenizer.encode_batch(chunks)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        chunk_embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        embedding = chunk_embeddings.mean(axis=0)
+        embedding /= max(np.linalg.norm(embedding), 1e-9)
+        return embedding.astype(np.float32)
+
+    def lookup(self, embedding):
+        """Return the refined JSON of the nearest cached transcript within the threshold, or None."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT rowid, refined_json, created_at, distance FROM cache WHERE embedding MATCH ? AND k = 1",
+                (embedding.tobytes(),)
+            ).fetchone()
+
+            if row is None:
+                return None
+            rowid, refined_json, created_at, distance = row
+
+            if self.ttl_seconds and time.time() - created_at > self.ttl_seconds:
+                self.db.execute("DELETE FROM cache WHERE rowid = ?", (rowid,))
+                self.db.commit()
+                return None
+
+        if distance >= self.threshold:
+            return None
+        logger.info(f"Semantic cache hit (cosine distance {distance:.4f})")
+        return orjson.loads(refined_json)
+
+    def store(self, embedding, refined_data):
+        """Insert a refined transcript under its transcript embedding."""
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO cache(embedding, refined_json, created_at) VALUES (?, ?, ?)",
+                (embedding.tobytes(), orjson.dumps(refined_data).decode(), int(time.time()))
+            )
+            self.db.commit()
+
+def get_semantic_cache(config):
+    """
+    Return the process-wide SemanticCache, or None when it is disabled in config
+    ("semantic_cache": true enables it) or fails to initialize.
+    """
+    global _CACHE
+    if not config.get("semantic_cache", False):
+        return None
+
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                _CACHE = SemanticCache(
+                    config.get("semantic_cache_db", "semantic_cache.db"),
+                    config.get("semantic_cache_model_dir", "models/all-MiniLM-L6-v2"),
+                    threshold=config.get("semantic_cache_threshold", 0.05),
+                    ttl_seconds=config.get("semantic_cache_ttl_seconds")
+                )
+            except Exception as e:
+                logger.error(f"Semantic cache disabled: {e}")
+                _CACHE = False
+        return _CACHE or None
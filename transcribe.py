@@ -11,43 +11,54 @@ import utils
 def process_file(file_path, config):
     """
     Stage 1 Logic:
-    1. Extract audio
+    0. Skip everything if a fresh transcript is cached
+    1. Decode audio (straight into memory, no temp wav)
     2. Transcribe
-    3. Cleanup audio
     """
     file_path = Path(file_path)
+    json_path = file_path.with_suffix('.json')
     # print(f"{Fore.CYAN}Stage 1 Processing: {file_path}{Style.RESET_ALL}")
     
     try:
-        temp_audio = file_path.with_suffix('.wav')
-        
+        # 0. Cache check before any decoding work
+        if utils.cached_transcript_is_fresh(str(file_path), config.get("word_timestamps", False)):
+            return f"Skipped: {json_path.name} is already up to date"
+
         # 1. Extract
-        if not utils.extract_audio(str(file_path), str(temp_audio), config.get("enable_audio_cleaning", False)):
+        audio = utils.load_audio(str(file_path), config.get("enable_audio_cleaning", False))
+        if audio is None:
             return f"Failed extract: {file_path.name}"
         
-        # 2. Transcribe
+        # 2. Transcribe (cached next to the video as <stem>.json)
         try:
-            result, lang = utils.transcribe_audio(str(temp_audio), config.get("model_size", "small"))
+            result, lang = utils.transcribe_audio(
+                str(file_path), config.get("model_size", "small"), audio=audio,
+                word_timestamps=config.get("word_timestamps", False),
+                compute_type=config.get("whisper_compute_type")
+            )
         except Exception as e:
             return f"Failed transcribe: {file_path.name} - {e}"
-
-        # 3. Cleanup audio if needed
-        if temp_audio.exists():
-            try: os.remove(temp_audio)
-            except: pass
             
-        json_path = file_path.with_suffix('.json')
         return f"Success: Transcript saved to {json_path.name}"
 
     except Exception as e:
         return f"Error: {e}"
 
-def wrapper_process(file_path):
-    """Wrapper to load config inside the worker process."""
-    # Ensure FFMPEG in PATH for the worker
+_CONFIG = {}
+
+def _init_worker(config):
+    """
+    Runs once per worker, before any files are dispatched: keep the parent's
+    parsed config, put FFmpeg on PATH and load the Whisper model.
+    """
+    global _CONFIG
+    _CONFIG = config
     os.environ["PATH"] += os.pathsep + os.getcwd()
-    config = utils.load_config("config.json")
-    return process_file(file_path, config)
+    utils.setup_logging(console=False)
+    utils.load_whisper_model(config.get("model_size", "small"), compute_type=config.get("whisper_compute_type"))
+
+def wrapper_process(file_path):
+    return process_file(file_path, _CONFIG)
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()
@@ -59,20 +70,43 @@ if __name__ == "__main__":
     parser.add_argument("--workers", "-w", type=int, default=4)
     args = parser.parse_args()
 
+    config = utils.get_config("config.json")
+
     input_path = Path(args.input)
     files = []
     if input_path.is_file():
         files = [input_path]
     elif input_path.is_dir():
-        files = list(input_path.glob("*.mp4"))
+        # One directory listing; videos with an up-to-date transcript (.json) are skipped
+        with os.scandir(input_path) as it:
+            names = {e.name for e in it if e.is_file()}
+        files = [
+            input_path / n for n in sorted(names)
+            # Case-insensitive like Path.glob on Windows (camera files are often .MP4)
+            if n.lower().endswith(".mp4") and not (
+                Path(n).with_suffix('.json').name in names
+                and utils.cached_transcript_is_fresh(input_path / n, config.get("word_timestamps", False))
+            )
+        ]
 
     if not files:
-        print("No files found.")
+        print("No files found (or all already transcribed).")
         exit()
 
-    print(f"{Fore.CYAN}Starting Stage 1 processing for {len(files)} files with {args.workers} workers...{Style.RESET_ALL}")
+    workers = args.workers
+    if utils.default_device() == "cuda":
+        # The GPU is the bottleneck; one worker with batched decoding keeps it saturated
+        workers = 1
+
+    print(f"{Fore.CYAN}Starting Stage 1 processing for {len(files)} files with {workers} workers...{Style.RESET_ALL}")
 
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+    # spawn keeps each worker's torch/CUDA state clean instead of inheriting the parent's
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config,)
+    ) as executor:
         futures = {executor.submit(wrapper_process, f): f for f in files}
         for future in tqdm(futures, total=len(files), desc="Processing"):
             tqdm.write(future.result())
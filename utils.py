@@ -1,21 +1,67 @@
 import os
-import json
+import orjson
+import functools
+import collections
+import bisect
+import subprocess
+import tempfile
+import hashlib
+import sqlite3
 import logging
 from pathlib import Path
-import re
 import time
+import queue
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import ffmpeg
-import whisper
+import ijson
+import numpy as np
 from google import genai
-from moviepy import VideoFileClip, concatenate_videoclips, vfx
+from google.genai import types, errors
+from tenacity import retry, retry_if_exception, wait_exponential_jitter, stop_after_attempt, before_sleep_log
 from colorama import Fore, Style
 
+import prompts
+from semantic_cache import get_semantic_cache
+
 logger = logging.getLogger(__name__)
 
-def setup_logging(is_main_process=False):
-    """Configure logging for the application."""
-    handlers = [logging.StreamHandler()]
-    if is_main_process:
+# Glyphs Whisper emits when it hallucinates on silence/noise
+_GARBAGE_CHARS = {ord('ḍ'): None, ord('ὁ'): None}
+
+# (model_size, device, compute_type) -> loaded Whisper model, reused across every file a worker handles
+_MODEL_CACHE = {}
+
+GEMINI_MODEL_NAME = 'gemini-3-flash-preview'
+GEMINI_CACHE_TTL_SECONDS = 3600
+# Gemini rejects cached content below this many tokens
+GEMINI_MIN_CACHE_TOKENS = 1024
+# Rough chars-per-token ratio, good enough to tell whether the prefix can be cached
+CHARS_PER_TOKEN = 4
+
+# model_name -> (cache name or None, monotonic expiry)
+_PROMPT_CACHES = {}
+_PROMPT_CACHE_LOCK = threading.Lock()
+
+# Rate limits and transient server errors worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Exact-match cache of refined results, one <blake2b>.json per prompt
+GEMINI_RESPONSE_CACHE_DIR = Path(".gemini_cache")
+
+# Process-wide GeminiBatcher behind process_with_gemini
+_BATCHER = None
+_BATCHER_LOCK = threading.Lock()
+
+def setup_logging(is_main_process=False, console=True):
+    """
+    Configure logging for the application.
+    Pool workers pass console=False to log to pipeline.log only, so model
+    chatter from several processes doesn't contend for the shared terminal.
+    """
+    handlers = [logging.StreamHandler()] if console else []
+    if is_main_process or not console:
         handlers.append(logging.FileHandler("pipeline.log", encoding='utf-8'))
     
     logging.basicConfig(
@@ -28,193 +74,793 @@ def setup_logging(is_main_process=False):
 def load_config(path):
     """Load configuration from JSON file."""
     try:
-        with open(path, 'r') as f:
-            return json.load(f)
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         logger.error(f"Failed to load config: {e}")
         return {}
 
+@functools.lru_cache(maxsize=1)
+def get_config(path="config.json"):
+    """Load config once per process; callers share the returned dict, so don't mutate it."""
+    return load_config(path)
+
+def write_json_atomic(path, data):
+    """
+    Serialize `data` to `path` via a temp file and os.replace, so readers (and
+    the skip/cache checks of later runs) never see a half-written file.
+    """
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, 'wb') as f:
+            # numpy scalars (e.g. from faster-whisper) serialize like floats
+            f.write(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY))
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
 def filter_hallucinations(text):
-    """Filter out common Whisper hallucinations."""
-    if not text:
+    """Filter out common Whisper hallucinations (segments made only of garbage glyphs and whitespace)."""
+    if not text or not text.strip():
         return ""
-    garbage_pattern = r'[ḍὁ\s]+'
-    if re.fullmatch(garbage_pattern, text):
+    # Deleting the garbage glyphs is a C-level table lookup; no regex engine per segment
+    if not text.translate(_GARBAGE_CHARS).strip():
         return ""
     return text
 
-def extract_audio(video_path, audio_path, enable_cleaning=False):
-    """Extract audio from video using FFmpeg."""
+# Speech band-pass + loudness normalization, applied in the extraction pass itself
+AUDIO_CLEANING_FILTERS = 'highpass=f=200,lowpass=f=3000,dynaudnorm'
+
+def _audio_output_args(enable_cleaning=False):
+    """
+    FFmpeg output options for Whisper audio: mono 16kHz, with video, subtitle and
+    data streams dropped (-vn/-sn/-dn) so they are never decoded, and the cleaning
+    chain as a plain -af filter in the same process.
+    """
+    args = dict(ac=1, ar=16000, vn=None, sn=None, dn=None)
+    if enable_cleaning:
+        args['af'] = AUDIO_CLEANING_FILTERS
+    return args
+
+def load_audio(video_path, enable_cleaning=False):
+    """
+    Decode (and optionally clean) a video's audio straight into the 16kHz mono
+    float32 array Whisper expects, piping raw PCM from FFmpeg instead of
+    round-tripping through a temporary wav. Returns None on FFmpeg failure.
+    """
     try:
-        (
+        out, _ = (
             ffmpeg
             .input(video_path)
-            .output(audio_path, ac=1, ar=16000) # Mono, 16kHz for Whisper
-            .overwrite_output()
-            .run(quiet=True)
+            .output('pipe:', format='s16le', acodec='pcm_s16le', **_audio_output_args(enable_cleaning))
+            .run(capture_stdout=True, capture_stderr=True)
         )
-        
-        if enable_cleaning:
-            clean_audio = str(Path(audio_path).with_suffix('.clean.wav'))
-            try:
-                (
-                    ffmpeg
-                    .input(audio_path)
-                    .filter('highpass', f='200')
-                    .filter('lowpass', f='3000')
-                    .filter('dynaudnorm')
-                    .output(clean_audio)
-                    .overwrite_output()
-                    .run(quiet=True)
-                )
-                # Retry loop for Windows file locking
-                for _ in range(3):
-                    try:
-                        time.sleep(0.5)
-                        if os.path.exists(audio_path):
-                            os.remove(audio_path)
-                        os.rename(clean_audio, audio_path)
-                        break
-                    except PermissionError:
-                        continue
-            except ffmpeg.Error:
-                pass
-        
-        return True
     except ffmpeg.Error as e:
+        if enable_cleaning:
+            # Cleaning is best-effort; fall back to the raw track
+            logger.warning(f"Audio cleaning failed for {video_path}, using unfiltered audio")
+            return load_audio(video_path, enable_cleaning=False)
         logger.error(f"FFmpeg extract error: {e.stderr.decode() if e.stderr else str(e)}")
+        return None
+
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+def default_device():
+    """Return "cuda" when CTranslate2 can see a GPU, otherwise "cpu"."""
+    import ctranslate2
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+def load_whisper_model(model_size="small", device=None, compute_type=None):
+    """
+    Load a faster-whisper model once per process and return the cached instance afterwards.
+    CPU defaults to int8 weights; on GPU the model defaults to float16 behind a
+    BatchedInferencePipeline so several 30s chunks are decoded per step.
+    `compute_type` overrides the CTranslate2 precision (e.g. "int8_float16").
+    """
+    device = device or default_device()
+    compute_type = compute_type or ("float16" if device == "cuda" else "int8")
+    key = (model_size, device, compute_type)
+
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        # Imported here so Stage 2/3 and transcript cache hits never pay for the Whisper stack
+        from faster_whisper import WhisperModel, BatchedInferencePipeline
+        logger.info(f"Loading Whisper model ({model_size}) on {device} ({compute_type})...")
+        if device == "cuda":
+            model = BatchedInferencePipeline(model=WhisperModel(model_size, device="cuda", compute_type=compute_type))
+        else:
+            model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        _MODEL_CACHE[key] = model
+    return model
+
+def source_fingerprint(path):
+    """(mtime, size) of a source file, stored in its transcript to detect stale caches."""
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def cached_transcript_is_fresh(source_path, word_timestamps=False):
+    """
+    Return True if <stem>.json next to `source_path` was transcribed from this
+    exact file (same mtime and size), with word timestamps if they are asked
+    for. Only the leading "source" key is parsed.
+    """
+    try:
+        with open(Path(source_path).with_suffix('.json'), 'rb') as f:
+            cached_source = next(ijson.items(f, 'source'), None)
+    except (OSError, ijson.JSONError):
         return False
+    if not isinstance(cached_source, dict):
+        return False
+    has_words = cached_source.pop("word_timestamps", False)
+    return cached_source == source_fingerprint(source_path) and (has_words or not word_timestamps)
 
-def transcribe_audio(audio_path, model_size="small", device="cpu"):
-    """Transcribe audio using Whisper."""
+def transcribe_audio(audio_path, model_size="small", device=None, audio=None, word_timestamps=False, compute_type=None):
+    """
+    Transcribe audio using Whisper.
+    The transcript is cached next to `audio_path` as <stem>.json, tagged with
+    the source file's fingerprint so edits to the source invalidate it. Pass an
+    already decoded `audio` array (see load_audio) to transcribe it instead of
+    reading `audio_path`. Word-level timestamps cost an extra alignment pass
+    and nothing downstream reads them, so they are opt-in.
+    """
     try:
         json_cache = Path(audio_path).with_suffix('.json')
-        if json_cache.exists():
+        if cached_transcript_is_fresh(audio_path, word_timestamps):
             try:
-                with open(json_cache, 'r') as f:
-                    data = json.load(f)
+                with open(json_cache, 'rb') as f:
+                    data = orjson.loads(f.read())
                     return data, data["language"]
             except:
                 pass
 
-        logger.info(f"Loading Whisper model ({model_size})...")
-        model = whisper.load_model(model_size, device=device)
+        model = load_whisper_model(model_size, device, compute_type)
+        from faster_whisper import BatchedInferencePipeline
         
         logger.info(f"Transcribing {audio_path}...")
-        # verbose=True gives live terminal output per segment
-        result = model.transcribe(audio_path, word_timestamps=True, verbose=True)
+        # vad_filter skips silent stretches before they reach the decoder
+        options = dict(word_timestamps=word_timestamps, beam_size=5, vad_filter=True)
+        if isinstance(model, BatchedInferencePipeline):
+            options["batch_size"] = 16
+        segments_iter, info = model.transcribe(audio if audio is not None else audio_path, **options)
         
-        for segment in result["segments"]:
-            segment["text"] = filter_hallucinations(segment["text"])
+        # Keep the openai-whisper JSON layout that Stage 2 and the cache expect.
+        # Timings come back as numpy scalars when words are aligned, so float() them.
+        segments = []
+        for s in segments_iter:
+            segment = {
+                "id": s.id,
+                "start": float(s.start),
+                "end": float(s.end),
+                "text": filter_hallucinations(s.text)
+            }
+            if word_timestamps:
+                segment["words"] = [
+                    {"word": w.word, "start": float(w.start), "end": float(w.end), "probability": float(w.probability)}
+                    for w in (s.words or [])
+                ]
+            segments.append(segment)
+
+        # "source" goes first so cached_transcript_is_fresh can stop parsing early
+        result = {
+            "source": {**source_fingerprint(audio_path), "word_timestamps": word_timestamps},
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": info.language
+        }
             
-        with open(json_cache, 'w') as f:
-            json.dump(result, f)
+        write_json_atomic(json_cache, result)
             
         return result, result["language"]
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         raise
 
-def process_with_gemini(transcript_json_path, config, prompt_text):
-    """
-    Send Whisper transcript to Gemini using the google-genai SDK.
-    Accepts the fully constructed prompt text.
-    """
+def _get_gemini_api_key(config):
+    """Return the Gemini API key from config, raising if it was never set."""
     api_key = config.get("gemini_api_key")
     if not api_key or api_key == "YOUR_API_KEY_HERE":
         raise ValueError("Please set 'gemini_api_key' in config.json")
+    return api_key
 
-    # Initialize New SDK Client
-    client = genai.Client(api_key=api_key)
-    
-    model_name = 'gemini-3-flash-preview' # Or config choice
-    
-    logger.info(f"Sending transcript {transcript_json_path} to Gemini ({model_name})...")
-    
+def get_prompt_cache(client, model_name):
+    """
+    Upload the static instruction prefix as Gemini cached content (once per process)
+    and return the cache name. Returns None if caching is unavailable; callers then
+    send it inline. A prefix that is estimated to be below the model's minimum
+    cacheable size is never uploaded.
+    """
+    with _PROMPT_CACHE_LOCK:
+        cache_name, expires_at = _PROMPT_CACHES.get(model_name, (None, 0))
+        # Refresh a minute early so in-flight requests never reference an expired cache
+        if time.monotonic() < expires_at - 60:
+            return cache_name
+
+        # Local estimate, so a too-small prefix costs no extra API round trip
+        tokens = len(prompts.GEMINI_PROMPT_PREFIX) // CHARS_PER_TOKEN
+        if tokens < GEMINI_MIN_CACHE_TOKENS:
+            # The prefix is static, so this holds for the life of the process
+            logger.info(f"Instruction prefix is ~{tokens} tokens (< {GEMINI_MIN_CACHE_TOKENS}), sending it inline without context caching")
+            _PROMPT_CACHES[model_name] = (None, float('inf'))
+            return None
+
+        try:
+            cache = client.caches.create(
+                model=model_name,
+                config=types.CreateCachedContentConfig(
+                    contents=[prompts.GEMINI_PROMPT_PREFIX],
+                    ttl=f"{GEMINI_CACHE_TTL_SECONDS}s"
+                )
+            )
+            cache_name = cache.name
+            logger.info(f"Created Gemini context cache {cache_name}")
+        except Exception as e:
+            logger.warning(f"Gemini context caching unavailable, sending instructions inline: {e}")
+            cache_name = None
+
+        _PROMPT_CACHES[model_name] = (cache_name, time.monotonic() + GEMINI_CACHE_TTL_SECONDS)
+        return cache_name
+
+@functools.lru_cache(maxsize=4)
+def get_genai_client(api_key):
+    """
+    Return one google-genai client per API key for the life of the process,
+    so its HTTP connection pool (and TLS sessions) stay warm across calls.
+    """
+    return genai.Client(api_key=api_key)
+
+def get_gemini_client(config):
+    """Return the shared google-genai client for the API key in config."""
+    return get_genai_client(_get_gemini_api_key(config))
+
+class RateLimiter:
+    """Space out calls so no more than `rpm` start per minute, across all threads of the process."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter(rpm):
+    """Return the shared RateLimiter for `rpm` (config "gemini_rpm"), or None when unlimited."""
+    return RateLimiter(rpm) if rpm else None
+
+def _is_retryable(e):
+    return isinstance(e, errors.APIError) and e.code in RETRYABLE_STATUS_CODES
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(6),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+def _open_stream(client, model_name, contents, config, limiter=None):
+    """
+    Start a streaming Gemini request and wait for its first chunk, retrying
+    429s and transient 5xx with exponential backoff + jitter. Errors after the
+    first chunk are not retried, since values may already have been consumed.
+    """
+    if limiter:
+        limiter.acquire()
+    stream = client.models.generate_content_stream(
+        model=model_name,
+        contents=contents,
+        config=config
+    )
+    return next(stream, None), stream
+
+def _stream_json(client, model_name, prompt_text, prefix='', limiter=None, context_cache=False):
+    """
+    Stream a Gemini JSON-mode response and yield the values found at ijson
+    `prefix` as soon as each one is complete, so parsing overlaps with the
+    network receive. prefix='' yields the whole top-level value; 'item' yields
+    each element of a top-level array.
+    `prompt_text` is only the per-request chunk; the shared instructions come
+    from the context cache when `context_cache` is set and the prefix is
+    cacheable, and are prepended otherwise.
+    """
+    cache_name = get_prompt_cache(client, model_name) if context_cache else None
+    if cache_name:
+        contents = prompt_text
+        config = types.GenerateContentConfig(cached_content=cache_name, response_mime_type='application/json')
+    else:
+        contents = prompts.GEMINI_PROMPT_PREFIX + prompt_text
+        config = types.GenerateContentConfig(response_mime_type='application/json')
+
+    first_chunk, stream = _open_stream(client, model_name, contents, config, limiter)
+
+    values = ijson.sendable_list()
+    parser = ijson.items_coro(values, prefix, use_float=True)
+    for chunk in itertools.chain([first_chunk] if first_chunk else [], stream):
+        if chunk.text:
+            parser.send(chunk.text.encode('utf-8'))
+            yield from values
+            del values[:]
+    # Raises ijson.IncompleteJSONError if the stream was cut off mid-document
+    parser.close()
+    yield from values
+
+def save_refined_json(transcript_json_path, refined_data):
+    """Write refined segment metadata next to its transcript as <stem>_refined.json."""
+    refined_path = Path(transcript_json_path).with_name(f"{Path(transcript_json_path).stem}_refined.json")
+    write_json_atomic(refined_path, refined_data)
+    return refined_path
+
+def transcript_text(transcript):
+    """Concatenate the text of a simplified transcript (used as the semantic cache key)."""
+    return " ".join(seg.get("text", "").strip() for seg in transcript)
+
+def _response_cache_key(model_name, prompt_text):
+    """BLAKE2b-128 of everything that determines the response: model, shared instructions, per-file prompt."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in (model_name, prompts.GEMINI_PROMPT_PREFIX, prompt_text):
+        h.update(part.encode('utf-8'))
+    return h.hexdigest()
+
+def _load_cached_response(key):
+    """Return the refined data cached under `key`, or None."""
     try:
-        response = client.models.generate_content(
-            model=model_name,
-            contents=prompt_text,
-            config={'response_mime_type': 'application/json'}
+        with open(GEMINI_RESPONSE_CACHE_DIR / f"{key}.json", 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+def _store_cached_response(key, refined_data):
+    """Write refined data to the response cache."""
+    GEMINI_RESPONSE_CACHE_DIR.mkdir(exist_ok=True)
+    write_json_atomic(GEMINI_RESPONSE_CACHE_DIR / f"{key}.json", refined_data)
+
+def _fits_transcript(refined_data, transcript):
+    """
+    True if every selected segment of `refined_data` starts and ends on a segment
+    boundary of `transcript`. A semantic-cache hit comes from another (similar)
+    video, and its cut points are only usable if they exist in this one.
+    """
+    starts = {seg["start"] for seg in transcript}
+    ends = {seg["end"] for seg in transcript}
+    try:
+        return all(
+            round(seg["start"], 2) in starts and round(seg["end"], 2) in ends
+            for seg in refined_data.get("meaningful_segments", [])
         )
-        
-        refined_data = json.loads(response.text)
-        
-        # Handle case where Gemini returns a list
-        if isinstance(refined_data, list):
-            if len(refined_data) > 0:
-                refined_data = refined_data[0]
+    except (AttributeError, KeyError, TypeError):
+        return False
+
+def get_gemini_batcher(config, client=None, **options):
+    """
+    Return the process-wide GeminiBatcher, creating it on first use. `options`
+    (max_batch, max_wait_ms, max_concurrency, ...) only apply to that first call.
+    """
+    global _BATCHER
+    with _BATCHER_LOCK:
+        if _BATCHER is None:
+            _BATCHER = GeminiBatcher(config, client=client, **options)
+        return _BATCHER
+
+def process_with_gemini(transcript_json_path, config, transcript, text=None, no_cache=False, client=None):
+    """
+    Send a simplified Whisper transcript (list of start/end/text dicts) to Gemini
+    and save the result next to it. Returns (refined_data, refined_path).
+    Concurrent calls are coalesced into multi-transcript requests by the shared
+    GeminiBatcher; repeats are served from the response/semantic caches unless
+    `no_cache` is set. `text` is the transcript's plain text if already known.
+    """
+    return get_gemini_batcher(config, client=client).submit(
+        transcript_json_path, transcript, text=text, no_cache=no_cache
+    ).result()
+
+# One queued transcript; key is None when the response cache is bypassed
+_BatchRequest = collections.namedtuple("_BatchRequest", "id path transcript future key embedding")
+
+class GeminiBatcher:
+    """
+    Coalesce Stage 2 transcripts into multi-document Gemini requests.
+
+    Callers `submit` one simplified transcript at a time and get back a Future
+    resolving to `(refined_data, refined_path)`. A background flush thread groups
+    up to `max_batch` pending transcripts (waiting at most `max_wait_ms` for a
+    batch to fill) into a single prompt and routes each element of the returned
+    JSON array back to its Future by id. Pending transcripts are ordered by
+    segment count so short ones don't sit behind long ones. Up to
+    `max_concurrency` batches are in flight at once; while all slots are busy
+    new submissions keep filling the next batch.
+    """
+
+    def __init__(self, config, max_batch=1, max_wait_ms=200, max_concurrency=4, queue_size=64, client=None):
+        self.client = client or get_gemini_client(config)
+        self.cache = get_semantic_cache(config)
+        self.limiter = get_rate_limiter(config.get("gemini_rpm"))
+        self.context_cache = config.get("gemini_context_cache", False)
+        # response cache key -> Future of the queued request for it
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.model_name = GEMINI_MODEL_NAME
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.PriorityQueue(maxsize=queue_size)
+        self._seq = itertools.count()
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="gemini-batch")
+        self._thread = threading.Thread(target=self._run, name="gemini-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, transcript_json_path, transcript, text=None, no_cache=False):
+        """
+        Queue a simplified transcript (list of start/end/text dicts) for refinement.
+        `text` is the transcript's plain text if the caller already has it.
+        """
+        future = Future()
+
+        key = _response_cache_key(self.model_name, prompts.GEMINI_PROMPT_USER_TEMPLATE.format(
+            transcript_json=orjson.dumps(transcript).decode()
+        ))
+        embedding = None
+        if not no_cache:
+            # Exact repeat first; only embed (a full ONNX pass) on a miss
+            refined_data = _load_cached_response(key)
+            if refined_data is None and self.cache:
+                embedding = self.cache.embed(text if text is not None else transcript_text(transcript))
+                refined_data = self.cache.lookup(embedding)
+                if refined_data is not None and not _fits_transcript(refined_data, transcript):
+                    logger.info(f"Semantic cache hit for {transcript_json_path} rejected: its segments don't line up with this transcript")
+                    refined_data = None
+            if refined_data is not None:
+                future.set_result((refined_data, save_refined_json(transcript_json_path, refined_data)))
+                return future
+
+        with self._inflight_lock:
+            leader = self._inflight.get(key)
+            if leader is None:
+                self._inflight[key] = future
+        if leader is not None:
+            # Identical transcript already queued: reuse its result, write our own refined JSON
+            leader.add_done_callback(lambda done: self._follow(done, future, transcript_json_path))
+            return future
+        future.add_done_callback(lambda _: self._forget(key))
+
+        seq = next(self._seq)
+        request = _BatchRequest(str(seq), transcript_json_path, transcript, future, None if no_cache else key, embedding)
+        # Blocks when the queue is full, applying backpressure to the submitters
+        self._queue.put((len(transcript), seq, request))
+        return future
+
+    def _remember(self, key, embedding, refined_data):
+        """
+        Store a fresh Gemini result in whichever caches the request uses.
+        Best-effort: a cache failure is logged, never raised.
+        """
+        if key is not None:
+            try:
+                _store_cached_response(key, refined_data)
+            except OSError as e:
+                logger.warning(f"Could not write response cache entry {key}: {e}")
+        if embedding is not None:
+            try:
+                self.cache.store(embedding, refined_data)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Could not write semantic cache entry: {e}")
+
+    def _follow(self, leader, future, transcript_json_path):
+        try:
+            refined_data, _ = leader.result()
+            future.set_result((refined_data, save_refined_json(transcript_json_path, refined_data)))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _forget(self, key):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+
+    def close(self):
+        """Flush whatever is still pending, wait for in-flight batches and stop the flush thread."""
+        self._queue.put((float('inf'), next(self._seq), None))
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while True:
+            # Wait for a free request slot first, so pending transcripts keep
+            # piling into the next batch while every slot is busy
+            self._slots.acquire()
+            _, _, request = self._queue.get()
+            if request is None:
+                self._slots.release()
+                return
+
+            batch = [request]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    _, _, request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            self._executor.submit(self._flush, batch)
+            if stop:
+                return
+
+    def _flush(self, batch):
+        try:
+            self._send(batch)
+        finally:
+            self._slots.release()
+
+    def _send(self, batch):
+        pending = {request.id: request for request in batch}
+        error = None
+        try:
+            if len(batch) == 1:
+                prompt_text = prompts.GEMINI_PROMPT_USER_TEMPLATE.format(
+                    transcript_json=orjson.dumps(batch[0].transcript).decode()
+                )
+                prefix = ''
             else:
-                refined_data = {}
-        
-        # Save refined JSON
-        refined_path = Path(transcript_json_path).with_name(f"{Path(transcript_json_path).stem}_refined.json")
-        with open(refined_path, 'w', encoding='utf-8') as f:
-            json.dump(refined_data, f, indent=2)
-            
-        return refined_data, refined_path
-    except Exception as e:
-        logger.error(f"Gemini API Error: {e}")
-        if hasattr(e, 'response'):
-             logger.error(f"Response: {e.response}")
-        raise
+                prompt_text = prompts.GEMINI_BATCH_PROMPT_USER_TEMPLATE.format(
+                    transcripts_json=orjson.dumps(
+                        [{"id": request.id, "transcript": request.transcript} for request in batch]
+                    ).decode()
+                )
+                # Resolve each transcript as soon as its array element has streamed in
+                prefix = 'item'
+
+            logger.info(f"Sending batch of {len(batch)} transcript(s) to Gemini ({self.model_name})...")
+            for item in _stream_json(self.client, self.model_name, prompt_text, prefix, self.limiter, self.context_cache):
+                if len(batch) == 1:
+                    if isinstance(item, list):
+                        item = item[0] if item else {}
+                    request = pending.pop(batch[0].id, None)
+                elif isinstance(item, dict):
+                    request = pending.pop(str(item.pop("id", None)), None)
+                else:
+                    request = None
+
+                if request is not None:
+                    self._resolve(request, item)
+        except Exception as e:
+            error = e
+
+        if not pending:
+            return
+        if len(batch) > 1:
+            # A truncated or malformed batch response shouldn't fail the transcripts
+            # it didn't cover; give each one its own request
+            logger.warning(f"{len(pending)} of {len(batch)} transcript(s) unresolved by a batched request ({error or 'missing results'}), retrying individually")
+            for request in pending.values():
+                self._send([request])
+            return
+
+        request, = pending.values()
+        if error is not None:
+            logger.error(f"Gemini API Error: {error}")
+            request.future.set_exception(error)
+        else:
+            request.future.set_exception(ValueError(f"Gemini returned no result for {Path(request.path).name}"))
+
+    def _resolve(self, request, refined_data):
+        # Deliver the (paid for) result before touching the caches
+        try:
+            request.future.set_result((refined_data, save_refined_json(request.path, refined_data)))
+        except Exception as e:
+            request.future.set_exception(e)
+            return
+        self._remember(request.key, request.embedding, refined_data)
+
+# Crossfade renders with more segments than this decode one input instead of seeking each
+SEEK_INPUTS_MAX = 16
+
+def _has_audio(video_path):
+    """Return True if the file has at least one audio stream."""
+    return any(stream.get("codec_type") == "audio" for stream in ffmpeg.probe(video_path)["streams"])
+
+def _keyframes(video_path):
+    """
+    Sorted keyframe timestamps of the first video stream. Reads packet flags
+    only (no decoding), so it is cheap even on long videos.
+    """
+    out = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    keyframes = []
+    for line in out.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+def _segment_pairs(segments):
+    """(start, end) of every usable segment; anything shorter than 0.5s is dropped."""
+    # Missing bounds become NaN, which fails the length check below
+    bounds = np.array(
+        [(seg.get("start"), seg.get("end")) for seg in segments], dtype=np.float64
+    ).reshape(-1, 2)
+    valid = (bounds[:, 1] - bounds[:, 0]) >= 0.5
+    return [tuple(pair) for pair in bounds[valid].tolist()]
+
+def _concat_stream_copy(video_path, pairs, output_path):
+    """
+    Hard-cut the segments without re-encoding: an ffconcat list with one
+    inpoint/outpoint entry per segment, copied through the concat demuxer.
+    Cut-in points snap back to the previous keyframe so every piece starts
+    on a decodable frame.
+    """
+    keyframes = _keyframes(video_path)
+    source = str(Path(video_path).resolve()).replace("'", "'\\''")
+
+    lines = ["ffconcat version 1.0"]
+    for start, end in pairs:
+        i = bisect.bisect_right(keyframes, start) - 1
+        inpoint = keyframes[i] if i >= 0 else 0.0
+        lines += [f"file '{source}'", f"inpoint {inpoint}", f"outpoint {end}"]
+
+    with tempfile.NamedTemporaryFile('w', suffix='.ffconcat', delete=False, encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+        list_path = f.name
+    try:
+        (
+            ffmpeg
+            .input(list_path, format='concat', safe=0)
+            .output(output_path, c='copy', avoid_negative_ts='make_zero')
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    finally:
+        os.remove(list_path)
+
+@functools.lru_cache(maxsize=1)
+def _use_nvenc():
+    """
+    True when FFmpeg can actually encode with h264_nvenc here (built with it,
+    and a GPU/driver is present): a one-frame test encode, checked once per
+    process. Any failure means no.
+    """
+    try:
+        subprocess.run(
+            ['ffmpeg', '-hide_banner', '-v', 'error', '-f', 'lavfi', '-i', 'nullsrc=s=256x256',
+             '-frames:v', '1', '-c:v', 'h264_nvenc', '-f', 'null', '-'],
+            capture_output=True, check=True, timeout=30
+        )
+        return True
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+def _decode_args():
+    """FFmpeg input options: decode on the GPU when we are also encoding there."""
+    return dict(hwaccel='cuda') if _use_nvenc() else {}
+
+def _encode_args():
+    """
+    FFmpeg video encoder options: NVENC when available, otherwise libx264 with a
+    fast preset (the default 'medium' preset dominates Stage 3 wall time).
+    """
+    if _use_nvenc():
+        return dict(vcodec='h264_nvenc', preset='p4', rc='vbr', cq=23)
+    return dict(vcodec='libx264', preset='veryfast', crf=23)
+
+def _render_hard_cuts(video_path, pairs, output_path):
+    """
+    Frame-accurate hard cuts in one decode/encode pass: select/aselect keep the
+    frames that fall inside any segment and timestamps are renumbered, so there
+    is a single decoder instead of one trim branch per segment.
+    """
+    keep = "+".join(f"between(t,{start},{end})" for start, end in pairs)
+    args = dict(vf=f"select='{keep}',setpts=N/FRAME_RATE/TB", **_encode_args())
+    if _has_audio(video_path):
+        args.update(af=f"aselect='{keep}',asetpts=N/SR/TB", acodec='aac')
+    (
+        ffmpeg
+        .input(video_path, **_decode_args())
+        .output(output_path, **args)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+def _render_crossfades(video_path, pairs, output_path, crossfade):
+    """
+    Cut every segment and cross-dissolve them with chained xfade/acrossfade
+    in one FFmpeg filter graph (one encode). Up to SEEK_INPUTS_MAX segments
+    are each their own input seeked with -ss/-t, so FFmpeg jumps to the
+    keyframe before the cut instead of decoding everything in between. Beyond
+    that, one demuxer/decoder per segment costs too much memory, so a single
+    input is decoded once and trimmed.
+    """
+    has_audio = _has_audio(video_path)
+
+    video_parts = []
+    audio_parts = []
+    if len(pairs) <= SEEK_INPUTS_MAX:
+        for start, end in pairs:
+            # Input seeking is still frame-accurate when transcoding; software
+            # decode so short windows don't each open a hwaccel context
+            source = ffmpeg.input(video_path, ss=start, t=end - start)
+            video_parts.append(source.video.setpts('PTS-STARTPTS'))
+            if has_audio:
+                audio_parts.append(source.audio.filter('asetpts', 'PTS-STARTPTS'))
+    else:
+        source = ffmpeg.input(video_path, **_decode_args())
+        for start, end in pairs:
+            video_parts.append(source.video.trim(start=start, end=end).setpts('PTS-STARTPTS'))
+            if has_audio:
+                audio_parts.append(
+                    source.audio
+                    .filter('atrim', start=start, end=end)
+                    .filter('asetpts', 'PTS-STARTPTS')
+                )
+
+    # Chain pairwise: each xfade starts `fade` seconds before the running output ends
+    video = video_parts[0]
+    audio = audio_parts[0] if has_audio else None
+    elapsed = pairs[0][1] - pairs[0][0]
+    for i in range(1, len(pairs)):
+        duration = pairs[i][1] - pairs[i][0]
+        fade = min(crossfade, elapsed / 2, duration / 2)
+        video = ffmpeg.filter([video, video_parts[i]], 'xfade', transition='fade', duration=fade, offset=elapsed - fade)
+        if has_audio:
+            audio = ffmpeg.filter([audio, audio_parts[i]], 'acrossfade', d=fade)
+        elapsed += duration - fade
+
+    outputs = [video, audio] if has_audio else [video]
+    (
+        ffmpeg
+        .output(*outputs, output_path, acodec='aac', **_encode_args())
+        .overwrite_output()
+        .run(quiet=True)
+    )
 
-def trim_video_from_segments(video_path, segments, output_path):
+def trim_video_from_segments(video_path, segments, output_path, crossfade=0.5, frame_accurate=False):
     """
-    Use MoviePy to cut and concatenate the meaningful segments with cross-dissolve transitions.
+    Cut and concatenate the meaningful segments.
+    With crossfade > 0 they are joined with cross-dissolve transitions (one
+    decode + encode pass); a single segment is simply re-encoded at its exact
+    bounds. Only an explicit crossfade=0 hard-cuts by stream copy, which moves
+    packets instead of pixels but starts each cut on the previous keyframe;
+    pass frame_accurate=True (or let a failed copy fall back) to re-encode
+    exact cuts with select/aselect instead.
     """
     if not segments:
         logger.warning("No segments found to keep!")
         return False
 
-    logger.info(f"Trimming video based on {len(segments)} segments using MoviePy...")
-    
-    clips = []
-    video = None
-    try:
-        video = VideoFileClip(video_path)
-        
-        for i, seg in enumerate(segments):
-            start = seg.get("start")
-            end = seg.get("end")
-            
-            if start is None or end is None or (end - start) < 0.5:
-                continue
-            
-            # Create subclip
-            clip = video.subclipped(start, end)
-            
-            # Apply fade in to all clips except the very first one
-            if i > 0:
-                clip = clip.with_effects([vfx.CrossFadeIn(0.5)])
-            
-            clips.append(clip)
+    pairs = _segment_pairs(segments)
+    if not pairs:
+        logger.warning("No valid clips created.")
+        return False
 
-        if not clips:
-            logger.warning("No valid clips created.")
-            return False
+    logger.info(f"Trimming video based on {len(pairs)} segments using FFmpeg...")
 
-        # Concatenate with 'compose' method to handle the crossfades
-        final_clip = concatenate_videoclips(clips, method="compose", padding=-0.5)
-        
-        # Write output
-        final_clip.write_videofile(
-            output_path, 
-            codec='libx264', 
-            audio_codec='aac', 
-            temp_audiofile='temp-audio.m4a', 
-            remove_temp=True,
-            logger=None # Suppress MoviePy's standard progress bar
-        )
-        
-        # Close clips to release resources
-        for clip in clips:
-            clip.close()
-        video.close()
-        
+    try:
+        if crossfade > 0 and len(pairs) > 1:
+            _render_crossfades(video_path, pairs, output_path, crossfade)
+        elif crossfade > 0 or frame_accurate:
+            _render_hard_cuts(video_path, pairs, output_path)
+        else:
+            try:
+                _concat_stream_copy(video_path, pairs, output_path)
+            except (ffmpeg.Error, subprocess.CalledProcessError) as e:
+                logger.warning(f"Stream copy failed for {video_path} ({e}), re-encoding cuts instead")
+                _render_hard_cuts(video_path, pairs, output_path)
         return True
 
-    except Exception as e:
-        logger.error(f"MoviePy trim error: {e}")
-        if video: video.close()
-        return False
\ No newline at end of file
+    except ffmpeg.Error as e:
+        logger.error(f"FFmpeg trim error: {e.stderr.decode() if e.stderr else str(e)}")
+        return False
@@ -1,18 +1,41 @@
 import argparse
 import multiprocessing
-import json
+import orjson
 import os
+import shutil
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import psutil
 from tqdm import tqdm
 from colorama import Fore, Style, init
 
 import utils
 
-def process_file(video_path, config):
+class _TitleTable(dict):
+    """
+    str.translate table for output file names: keeps letters and digits (any
+    script, e.g. Hebrew titles), spaces and '_', and drops everything else.
+    Each code point is classified once, on first sight, then looked up in C.
+    """
+    def __missing__(self, code):
+        c = chr(code)
+        self[code] = value = c if c.isalnum() or c in (' ', '_') else None
+        return value
+
+_TITLE_TABLE = _TitleTable()
+
+def load_refined(refined_json_path):
+    """Read a Stage 2 _refined.json (older outputs wrap the object in a list)."""
+    with open(refined_json_path, 'rb') as f:
+        refined_data = orjson.loads(f.read())
+    if isinstance(refined_data, list):
+        refined_data = refined_data[0] if refined_data else {}
+    return refined_data
+
+def process_file(video_path, config, refined_data=None):
     """
     Stage 3 Logic:
-    1. Find refined JSON
+    1. Find refined JSON (unless the parent already parsed it)
     2. Determine output path
     3. Cut video
     4. Move source files to processed
@@ -20,46 +43,38 @@ def process_file(video_path, config):
     video_path = Path(video_path)
     refined_json_path = video_path.with_name(f"{video_path.stem}_refined.json")
     
-    if not refined_json_path.exists():
+    if refined_data is None and not refined_json_path.exists():
         return f"Missing refined JSON for {video_path.name}. Run Stage 2 first."
 
     try:
-        with open(refined_json_path, 'r', encoding='utf-8') as f:
-            refined_data = json.load(f)
-            
-        if isinstance(refined_data, list):
-            refined_data = refined_data[0] if refined_data else {}
+        if refined_data is None:
+            refined_data = load_refined(refined_json_path)
         
         output_dir = Path("output")
         lang = refined_data.get("detected_language", "HE").upper()
         lang_dir = output_dir / lang
         lang_dir.mkdir(parents=True, exist_ok=True)
         
-        safe_title = "".join([c for c in refined_data.get("title", "video") if c.isalnum() or c in (' ', '_')]).rstrip()
-        safe_title = safe_title.replace(' ', '_')
+        safe_title = refined_data.get("title", "video").translate(_TITLE_TABLE).rstrip().replace(' ', '_')
         final_output = lang_dir / f"{video_path.stem}_{safe_title}_refined.mp4"
 
         segments = refined_data.get("meaningful_segments", [])
         
-        if utils.trim_video_from_segments(str(video_path), segments, str(final_output)):
+        crossfade = config.get("crossfade_duration", 0.5)
+        frame_accurate = config.get("frame_accurate_cuts", False)
+        if utils.trim_video_from_segments(str(video_path), segments, str(final_output), crossfade, frame_accurate):
             # Cleanup: Move source files to processed folder
             processed_root = Path("processed")
             video_folder = processed_root / video_path.stem
             video_folder.mkdir(parents=True, exist_ok=True)
 
             try:
-                # Move Original Video
-                if video_path.exists():
-                    video_path.rename(video_folder / video_path.name)
-                
-                # Move Transcript JSON (Stage 1)
-                transcript_json = video_path.with_suffix('.json')
-                if transcript_json.exists():
-                    transcript_json.rename(video_folder / transcript_json.name)
-
-                # Move Refined JSON (Stage 2)
-                if refined_json_path.exists():
-                    refined_json_path.rename(video_folder / refined_json_path.name)
+                # Original video, transcript JSON (Stage 1) and refined JSON (Stage 2).
+                # shutil.move falls back to copy + delete across filesystems.
+                to_move = [video_path, video_path.with_suffix('.json'), refined_json_path]
+                for src in to_move:
+                    if src.exists():
+                        shutil.move(str(src), str(video_folder / src.name))
                     
                 return f"Success! Video cut & source files moved to {video_folder}"
             except Exception as e:
@@ -70,10 +85,16 @@ def process_file(video_path, config):
     except Exception as e:
         return f"Error in Stage 3 for {video_path.name}: {str(e)}"
 
-def wrapper_process(video_path):
+_CONFIG = {}
+
+def _init_worker(config):
+    """Runs once per worker: keep the parent's parsed config and put FFmpeg on PATH."""
+    global _CONFIG
+    _CONFIG = config
     os.environ["PATH"] += os.pathsep + os.getcwd()
-    config = utils.load_config("config.json")
-    return process_file(video_path, config)
+
+def wrapper_process(video_path, refined_data=None):
+    return process_file(video_path, _CONFIG, refined_data)
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()
@@ -83,6 +104,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Stage 3 Video Processor (Cutting Only)")
     parser.add_argument("--input", "-i", type=str, default="input")
     parser.add_argument("--workers", "-w", type=int, default=4)
+    parser.add_argument("--max-workers-mem-gb", type=float, default=2.0, help="Expected peak RAM per worker; caps workers to what currently fits in memory")
     args = parser.parse_args()
 
     input_path = Path(args.input)
@@ -94,9 +116,25 @@ if __name__ == "__main__":
         print("No videos with refined transcripts (_refined.json) found in input folder.")
         exit()
 
-    print(f"{Fore.CYAN}Starting Stage 3 (Cutting) for {len(files)} files with {args.workers} workers...{Style.RESET_ALL}")
+    # Never start more workers than there are files, cores, or RAM for
+    mem_workers = int(psutil.virtual_memory().available // (args.max_workers_mem_gb * (1 << 30)))
+    workers = max(1, min(args.workers, len(files), os.cpu_count() or 1, mem_workers))
+
+    print(f"{Fore.CYAN}Starting Stage 3 (Cutting) for {len(files)} files with {workers} workers...{Style.RESET_ALL}")
+
+    config = utils.get_config("config.json")
+
+    # Parse every _refined.json here and ship the dicts to the workers; a file
+    # that fails to parse is passed as None so its worker reports the error
+    refined = []
+    for v in files:
+        try:
+            refined.append(load_refined(v.with_name(f"{v.stem}_refined.json")))
+        except (OSError, orjson.JSONDecodeError):
+            refined.append(None)
 
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        futures = {executor.submit(wrapper_process, f): f for f in files}
-        for future in tqdm(futures, total=len(files), desc="Cutting"):
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as executor:
+        futures = [executor.submit(wrapper_process, v, r) for v, r in zip(files, refined)]
+        # Report each cut as it finishes, not in submission order
+        for future in tqdm(as_completed(futures), total=len(files), desc="Cutting"):
             tqdm.write(future.result())